@@ -3,14 +3,12 @@
 Basic usage example for RoboLake CLI
 
 This example demonstrates how to use the RoboLake libraries programmatically.
+Install the package first (pip install -e .) so robolake_cli is importable.
 """
 
-import sys
 from pathlib import Path
 
-# Add the package to the path for development
-sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
-
+import pandas as pd
 from robolake_cli import ROSbagProcessor, DataCatalog
 from rich.console import Console
 
@@ -36,19 +34,19 @@ def main():
     # 2. Create a sample table
     console.print("\n2. Creating sample table")
     
+    # Catalog timestamps are timestamp[ns], like converted ROSbag data
     sample_data = {
-        "timestamp": [1.0, 2.0, 3.0, 4.0, 5.0],
+        "timestamp": pd.to_datetime([1.0, 2.0, 3.0, 4.0, 5.0], unit="s").as_unit("ns"),
         "topic": ["/imu", "/imu", "/gps", "/gps", "/imu"],
         "value": [0.1, 0.2, 42.0, 43.0, 0.3]
     }
     
-    import pandas as pd
     df = pd.DataFrame(sample_data)
     
     # Store in catalog
-    table_path = catalog_path / "tables" / "sample_data.parquet"
-    table_path.parent.mkdir(exist_ok=True)
-    df.to_parquet(table_path)
+    table_dir = catalog_path / "tables" / "sample_data"
+    table_dir.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(table_dir / "part-0.parquet")
     
     console.print("✅ Sample table created!")
     
@@ -56,10 +54,7 @@ def main():
     console.print("\n3. Querying sample data")
     
     try:
-        # Load tables into DuckDB
-        catalog._load_tables_to_duckdb()
-        
-        # Execute a query
+        # Execute a query (tables are registered with DuckDB on demand)
         result = catalog.query("SELECT * FROM sample_data WHERE topic = '/imu'")
         
         console.print("📊 Query results:")
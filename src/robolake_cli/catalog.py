@@ -5,13 +5,25 @@ Manages local data storage and SQL querying capabilities.
 """
 
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Iterator
+from uuid import uuid4
+import os
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import duckdb
 import logging
-import json
+import shutil
 from datetime import datetime
 
+from .processor import PARQUET_WRITE_OPTIONS, ROW_GROUP_SIZE
+
+# On-disk catalog layout version, recorded in CATALOG_VERSION_FILE.
+# 2: tables are directories of part files with timestamp[ns] timestamps.
+CATALOG_VERSION = 2
+CATALOG_VERSION_FILE = ".catalog_version"
+
 class DataCatalog:
     """Manages local data catalog for robotics data"""
     
@@ -22,57 +34,204 @@ class DataCatalog:
         # Create tables directory
         tables_dir = self.catalog_path / "tables"
         tables_dir.mkdir(exist_ok=True)
+        self._tables_dir = str(tables_dir)
+        self._migrate_legacy_tables()
         
-        # Initialize DuckDB connection for local queries
-        self.conn = duckdb.connect(":memory:")
+        # In-memory DuckDB connection, opened on the first query so that
+        # converting and listing never touch DuckDB
+        self._conn: Optional[duckdb.DuckDBPyConnection] = None
+        
+        # Registered views, mapped to their table directory mtime. Views
+        # are registered lazily on the first query.
+        self._registered: Dict[str, int] = {}
+    
+    @property
+    def conn(self) -> duckdb.DuckDBPyConnection:
+        """DuckDB connection for querying, opened on first use"""
+        if self._conn is None:
+            self._conn = duckdb.connect(":memory:")
+        return self._conn
     
-    def append_rosbag(self, table_name: str, rosbag_path: str, topics: List[str] = None) -> None:
-        """Append ROSbag data to catalog table"""
+    def append_rosbag(self, table_name: str, rosbag_path: str, topics: List[str] = None,
+                      split_by_msgtype: bool = False, max_workers: Optional[int] = None) -> List[str]:
+        """Append ROSbag data to catalog table
+        
+        With split_by_msgtype, each message type goes to its own table
+        ({table_name}_{package}_{type}), so queries on one sensor only
+        scan that sensor's narrow files. max_workers is passed on to
+        ROSbagProcessor.convert_to_parquet. Returns the tables written to.
+        """
         try:
             from .processor import ROSbagProcessor
             
-            # Process ROSbag
             processor = ROSbagProcessor(rosbag_path)
-            df = processor.convert_to_dataframe(topics)
+            if not split_by_msgtype:
+                appended = self._append_rosbag_part(table_name, processor, topics, max_workers)
+                return [table_name] if appended else []
             
-            if df.empty:
-                logging.warning("No data extracted from ROSbag")
-                return
+            # Metadata extraction swallows errors, which would silently
+            # leave no message types to split by
+            if "error" in processor.metadata:
+                raise RuntimeError(f"Could not read ROSbag metadata: {processor.metadata['error']}")
             
-            # Append to table
-            self._append_dataframe(table_name, df)
+            msgtype_topics = {}
+            for topic, msgtype in processor.get_topic_types().items():
+                if not topics or topic in topics:
+                    msgtype_topics.setdefault(msgtype, []).append(topic)
             
-            logging.info(f"Successfully appended ROSbag data to table: {table_name}")
+            written = []
+            for msgtype, type_topics in msgtype_topics.items():
+                suffix = msgtype.replace("/msg/", "_").replace("/", "_").lower()
+                msgtype_table = f"{table_name}_{suffix}"
+                if self._append_rosbag_part(msgtype_table, processor, type_topics, max_workers):
+                    written.append(msgtype_table)
+            return written
             
         except Exception as e:
             logging.error(f"Error appending ROSbag data: {e}")
             raise
     
-    def _append_dataframe(self, table_name: str, df: pd.DataFrame) -> None:
-        """Append DataFrame to table"""
-        table_path = self.catalog_path / "tables" / f"{table_name}.parquet"
+    def _append_rosbag_part(self, table_name: str, processor, topics: Optional[List[str]],
+                            max_workers: Optional[int] = None) -> bool:
+        """Convert ROSbag topics into a new part file of a table"""
+        # Process ROSbag straight into a new part file, no DataFrame
+        part_path = self._new_part_path(table_name)
+        try:
+            processor.convert_to_parquet(str(part_path), topics, max_workers=max_workers)
+        except Exception:
+            self._discard_part(part_path)
+            raise
         
-        if table_path.exists():
-            # Read existing data and append
-            existing_df = pd.read_parquet(table_path)
-            combined_df = pd.concat([existing_df, df], ignore_index=True)
-        else:
-            combined_df = df
+        if pq.ParquetFile(part_path).metadata.num_rows == 0:
+            self._discard_part(part_path)
+            logging.warning("No data extracted from ROSbag")
+            return False
         
-        # Write back to parquet
-        combined_df.to_parquet(table_path, index=False)
+        # The view is (re)created by the next query, which sees the new
+        # part through the table directory's mtime
+        logging.info(f"Successfully appended ROSbag data to table: {table_name}")
+        return True
+    
+    def _table_dir(self, table_name: str) -> Path:
+        """Get the dataset directory holding a table's part files"""
+        return self.catalog_path / "tables" / table_name
+    
+    def _new_part_path(self, table_name: str) -> Path:
+        """Get a fresh part file path in a table's directory"""
+        table_dir = self._table_dir(table_name)
+        table_dir.mkdir(exist_ok=True)
+        return table_dir / f"part-{uuid4().hex}.parquet"
+    
+    @staticmethod
+    def _discard_part(part_path: Path) -> None:
+        """Delete a part file, and its table directory if that leaves it empty"""
+        part_path.unlink(missing_ok=True)
+        # rmdir only removes an empty directory, which also keeps parts
+        # a concurrent append just wrote
+        try:
+            part_path.parent.rmdir()
+        except OSError:
+            pass
+    
+    @staticmethod
+    def _iter_part_files(table_dir: str) -> Iterator[os.DirEntry]:
+        """Yield a table's part files, including hive partition subdirectories"""
+        # scandir returns file types with the listing, so only directories
+        # we descend into cost an extra syscall
+        with os.scandir(table_dir) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    yield from DataCatalog._iter_part_files(entry.path)
+                elif entry.name.endswith(".parquet"):
+                    yield entry
+    
+    def _migrate_legacy_tables(self) -> None:
+        """Upgrade tables written by older versions to the current layout"""
+        version_file = self.catalog_path / CATALOG_VERSION_FILE
+        if version_file.exists() and int(version_file.read_text()) >= CATALOG_VERSION:
+            return
+        
+        # Single-file tables ({name}.parquet) move into dataset directories
+        for legacy_file in (self.catalog_path / "tables").glob("*.parquet"):
+            table_dir = self._table_dir(legacy_file.stem)
+            table_dir.mkdir(exist_ok=True)
+            legacy_file.rename(table_dir / f"part-{uuid4().hex}.parquet")
+        
+        # Older parts store timestamp as float seconds, which DuckDB can't
+        # union with the timestamp[ns] column of newer parts
+        with os.scandir(self._tables_dir) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    for part_file in self._iter_part_files(entry.path):
+                        self._migrate_float_timestamps(part_file.path)
+        
+        version_file.write_text(str(CATALOG_VERSION))
+    
+    @staticmethod
+    def _migrate_float_timestamps(part_path: str) -> None:
+        """Rewrite a part file's float seconds timestamp column as timestamp[ns]"""
+        pf = pq.ParquetFile(part_path)
+        index = pf.schema_arrow.get_field_index("timestamp")
+        if index < 0 or not pa.types.is_floating(pf.schema_arrow.field(index).type):
+            return
+        
+        logging.info(f"Migrating float timestamps in {part_path}")
+        # The pandas metadata would still describe the old float column
+        schema = pf.schema_arrow.set(index, pa.field("timestamp", pa.timestamp("ns")))
+        schema = schema.remove_metadata()
+        tmp_path = f"{part_path}.tmp"
+        with pq.ParquetWriter(tmp_path, schema, **PARQUET_WRITE_OPTIONS) as writer:
+            for batch in pf.iter_batches(batch_size=ROW_GROUP_SIZE):
+                nanoseconds = pc.cast(pc.round(pc.multiply(batch.column(index), 1e9)), pa.int64())
+                arrays = batch.columns
+                arrays[index] = nanoseconds.cast(pa.timestamp("ns"))
+                writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+        
+        # Swap in atomically, so an interrupted migration leaves the old part
+        os.replace(tmp_path, part_path)
+    
+    def _create_view(self, table_name: str) -> None:
+        """Create or replace the DuckDB view over a table's part files"""
+        table_dir = self._table_dir(table_name)
+        
+        # One glob per table, expanded inside DuckDB. Any subdirectory needs
+        # the recursive glob, matching the parts _iter_part_files lists;
+        # only key=value subdirectories turn on hive partition detection.
+        with os.scandir(table_dir) as entries:
+            subdirs = [entry.name for entry in entries if entry.is_dir()]
+        partitioned = any("=" in name for name in subdirs)
+        pattern = "**/*.parquet" if subdirs else "*.parquet"
         
-        # Update DuckDB view
         self.conn.execute(f"""
             CREATE OR REPLACE VIEW {table_name} AS 
-            SELECT * FROM read_parquet('{table_path}')
+            SELECT * FROM read_parquet(
+                '{table_dir}/{pattern}',
+                hive_partitioning={str(partitioned).lower()}, union_by_name=true
+            )
         """)
+        self._registered[table_name] = table_dir.stat().st_mtime_ns
     
-    def query(self, sql: str) -> pd.DataFrame:
-        """Execute SQL query against catalog"""
+    def register_df(self, table_name: str, df: pd.DataFrame) -> None:
+        """Register a DataFrame for querying without writing it to Parquet"""
+        # DuckDB scans numpy-backed columns in place; Arrow-backed frames
+        # are handed over as an Arrow table, which it also reads zero-copy
+        if any(isinstance(dtype, pd.ArrowDtype) for dtype in df.dtypes):
+            self.conn.register(table_name, pa.Table.from_pandas(df, preserve_index=False))
+        else:
+            self.conn.register(table_name, df)
+    
+    def query(self, sql: str, extra_tables: Optional[Dict[str, pd.DataFrame]] = None) -> pd.DataFrame:
+        """Execute SQL query against catalog
+        
+        extra_tables are registered for the duration of this query only.
+        """
+        extra_tables = extra_tables or {}
         try:
-            # First, try to load all available tables into DuckDB
-            self._load_tables_to_duckdb()
+            # Pick up tables added or changed since the last query
+            self._refresh_views()
+            
+            for table_name, df in extra_tables.items():
+                self.register_df(table_name, df)
             
             # Execute query
             result = self.conn.execute(sql)
@@ -83,34 +242,54 @@ class DataCatalog:
         except Exception as e:
             logging.error(f"Error executing query: {e}")
             raise
+        finally:
+            for table_name in extra_tables:
+                self.conn.unregister(table_name)
     
-    def _load_tables_to_duckdb(self) -> None:
-        """Load all tables from catalog into DuckDB for querying"""
-        tables_dir = self.catalog_path / "tables"
-        
-        if not tables_dir.exists():
-            return
-        
-        # Find all parquet files
-        for parquet_file in tables_dir.glob("*.parquet"):
-            table_name = parquet_file.stem
+    def query_batches(self, sql: str, batch_size: int = 10_000) -> pa.RecordBatchReader:
+        """Execute SQL query against catalog, streaming the result in batches"""
+        try:
+            self._refresh_views()
+            result = self.conn.execute(sql)
             
-            # Create view if it doesn't exist
-            self.conn.execute(f"""
-                CREATE OR REPLACE VIEW {table_name} AS 
-                SELECT * FROM read_parquet('{parquet_file}')
-            """)
+            # Newer DuckDB releases renamed fetch_record_batch
+            to_reader = getattr(result, "to_arrow_reader", None) or result.fetch_record_batch
+            return to_reader(batch_size)
+            
+        except Exception as e:
+            logging.error(f"Error executing query: {e}")
+            raise
     
-    def list_tables(self) -> List[str]:
-        """List all tables in the catalog"""
+    def _refresh_views(self) -> None:
+        """Register new or changed tables and drop views of removed ones"""
         tables = []
-        tables_dir = self.catalog_path / "tables"
         
-        if tables_dir.exists():
-            for parquet_file in tables_dir.glob("*.parquet"):
-                tables.append(parquet_file.stem)
+        for entry in self._iter_table_dirs():
+            tables.append(entry.name)
+            if self._registered.get(entry.name) != entry.stat().st_mtime_ns:
+                # A broken table must not keep queries on the others from running
+                try:
+                    self._create_view(entry.name)
+                except Exception as e:
+                    logging.warning(f"Error registering table {entry.name}: {e}")
         
-        return tables
+        for table_name in set(self._registered) - set(tables):
+            self.conn.execute(f"DROP VIEW IF EXISTS {table_name}")
+            del self._registered[table_name]
+    
+    def _iter_table_dirs(self) -> Iterator[os.DirEntry]:
+        """Yield the directory entries of tables holding at least one part file"""
+        try:
+            with os.scandir(self._tables_dir) as entries:
+                for entry in entries:
+                    if entry.is_dir() and next(self._iter_part_files(entry.path), None):
+                        yield entry
+        except FileNotFoundError:
+            return
+    
+    def list_tables(self) -> List[str]:
+        """List all tables in the catalog"""
+        return [entry.name for entry in self._iter_table_dirs()]
     
     def get_table_info(self, table_name: str) -> Dict[str, Any]:
         """Get information about a specific table"""
@@ -122,17 +301,24 @@ class DataCatalog:
             "size_bytes": 0
         }
         
-        # Check if table exists
-        table_path = self.catalog_path / "tables" / f"{table_name}.parquet"
-        if table_path.exists():
+        # Plain string paths, no Path objects; sizing each part still costs
+        # one stat() call, since scandir only returns file types for free
+        table_dir = os.path.join(self._tables_dir, table_name)
+        part_files = list(self._iter_part_files(table_dir)) if os.path.isdir(table_dir) else []
+        if part_files:
             info["exists"] = True
-            info["size_bytes"] = table_path.stat().st_size
+            info["size_bytes"] = sum(part_file.stat().st_size for part_file in part_files)
             
-            # Get row count
+            # Row count and columns come from the Parquet footers only
             try:
-                df = pd.read_parquet(table_path)
-                info["row_count"] = len(df)
-                info["columns"] = list(df.columns)
+                row_count = 0
+                columns = {}
+                for part_file in part_files:
+                    pf = pq.ParquetFile(part_file.path, memory_map=True)
+                    row_count += pf.metadata.num_rows
+                    columns.update(dict.fromkeys(pf.schema_arrow.names))
+                info["row_count"] = row_count
+                info["columns"] = list(columns)
             except Exception as e:
                 logging.warning(f"Error reading table for info: {e}")
         
@@ -141,13 +327,14 @@ class DataCatalog:
     def delete_table(self, table_name: str) -> bool:
         """Delete a table from the catalog"""
         try:
-            # Delete parquet file
-            table_path = self.catalog_path / "tables" / f"{table_name}.parquet"
-            if table_path.exists():
-                table_path.unlink()
+            # Delete the table's part files
+            table_dir = self._table_dir(table_name)
+            if table_dir.exists():
+                shutil.rmtree(table_dir)
             
-            # Remove from DuckDB
-            self.conn.execute(f"DROP VIEW IF EXISTS {table_name}")
+            # Remove from DuckDB, if a query has registered it
+            if self._registered.pop(table_name, None) is not None:
+                self.conn.execute(f"DROP VIEW IF EXISTS {table_name}")
             
             return True
             
@@ -18,6 +18,9 @@ from .catalog import DataCatalog
 
 console = Console()
 
+# Maximum number of result rows printed by the query command
+MAX_DISPLAY_ROWS = 1000
+
 @click.group()
 @click.version_option()
 def main():
@@ -33,7 +36,9 @@ def main():
 @click.option('--topics', help='Comma-separated list of topics to extract')
 @click.option('--output', '-o', help='Output file path')
 @click.option('--catalog', help='Data catalog path for storage')
-def convert(input_file, format, topics, output, catalog):
+@click.option('--workers', type=int, help='Worker processes for large bags (default: CPU count)')
+@click.option('--split-by-msgtype', is_flag=True, help='Store each message type in its own catalog table')
+def convert(input_file, format, topics, output, catalog, workers, split_by_msgtype):
     """Convert ROSbag file to specified format"""
     console.print(f"🤖 Converting {input_file} to {format}")
     
@@ -60,14 +65,14 @@ def convert(input_file, format, topics, output, catalog):
             
             # Convert based on format
             if format == 'parquet':
-                result_path = processor.convert_to_parquet(output, topic_list)
+                result_path = processor.convert_to_parquet(output, topic_list, max_workers=workers)
             elif format == 'csv':
-                df = processor.convert_to_dataframe(topic_list)
+                df = processor.convert_to_dataframe(topic_list, max_workers=workers)
                 df.to_csv(output, index=False)
                 result_path = output
             elif format == 'json':
-                df = processor.convert_to_dataframe(topic_list)
-                df.to_json(output, orient='records', indent=2)
+                df = processor.convert_to_dataframe(topic_list, max_workers=workers)
+                df.to_json(output, orient='records', indent=2, date_format='iso', date_unit='ns')
                 result_path = output
             
             progress.update(task, description="✅ Conversion complete!")
@@ -79,8 +84,14 @@ def convert(input_file, format, topics, output, catalog):
             console.print(f"🗄️  Storing in data catalog: {catalog}")
             data_catalog = DataCatalog(catalog)
             table_name = Path(input_file).stem
-            data_catalog.append_rosbag(table_name, input_file, topic_list)
-            console.print(f"✅ Data stored in table: {table_name}")
+            tables = data_catalog.append_rosbag(
+                table_name, input_file, topic_list,
+                split_by_msgtype=split_by_msgtype, max_workers=workers
+            )
+            if tables:
+                console.print(f"✅ Data stored in table: {', '.join(tables)}")
+            else:
+                console.print("⚠️  No data extracted, nothing stored in the catalog", style="yellow")
             
     except Exception as e:
         console.print(f"❌ Error converting file: {e}", style="red")
@@ -152,11 +163,27 @@ def query(catalog_path, sql_query):
     
     try:
         data_catalog = DataCatalog(catalog_path)
-        result = data_catalog.query(sql_query)
+        reader = data_catalog.query_batches(sql_query)
+        
+        # Stream the result, keeping only the rows that will be displayed
+        table = Table()
+        for name in reader.schema.names:
+            table.add_column(name)
+        
+        row_count = 0
+        for batch in reader:
+            remaining = MAX_DISPLAY_ROWS - row_count
+            if remaining > 0:
+                shown = batch.slice(0, remaining)
+                for row in zip(*(column.to_pylist() for column in shown.columns)):
+                    table.add_row(*(str(value) for value in row))
+            row_count += batch.num_rows
         
-        if not result.empty:
-            console.print(f"📊 Query returned {len(result)} rows:")
-            console.print(result.to_string())
+        if row_count:
+            console.print(f"📊 Query returned {row_count} rows:")
+            console.print(table)
+            if row_count > MAX_DISPLAY_ROWS:
+                console.print(f"... {row_count - MAX_DISPLAY_ROWS} more rows")
         else:
             console.print("📭 Query returned no results")
             
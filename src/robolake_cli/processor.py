@@ -4,10 +4,18 @@ ROSbag processor for RoboLake CLI
 Handles reading and converting ROSbag files to various formats.
 """
 
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from functools import cached_property
+from operator import attrgetter
 from pathlib import Path
-from typing import List, Optional, Dict, Any
+import struct
+import tempfile
+from typing import List, Optional, Dict, Any, Tuple, Iterator, Callable
+import os
 import pandas as pd
 import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.parquet as pq
 import logging
 
@@ -20,6 +28,292 @@ except ImportError:
     ROSBAGS_AVAILABLE = False
     logging.warning("rosbags library not available. Install with: pip install 'robolake-cli[rosbags]'")
 
+# Typestore shared by every reader in this process, built on first use.
+# AnyReader only reads type definitions from it, so it is safe to reuse.
+_TYPESTORE = None
+
+def _get_typestore():
+    """Get the default ROS2 typestore, creating it once per process"""
+    global _TYPESTORE
+    if _TYPESTORE is None:
+        _TYPESTORE = get_typestore(Stores.ROS2_FOXY)
+    return _TYPESTORE
+
+# Number of messages buffered per column before flushing a RecordBatch
+BATCH_SIZE = 65536
+
+# Rows per Parquet row group; each written batch becomes one row group
+ROW_GROUP_SIZE = 131072
+
+# Bags with fewer messages than this are converted in-process, since worker
+# startup would outweigh the parallel speedup
+PARALLEL_MIN_MESSAGES = 100_000
+
+# Writer options for Parquet output. Dictionary-encoding the low-cardinality
+# columns keeps their row-group statistics usable for filter pushdown.
+PARQUET_WRITE_OPTIONS = {
+    "compression": "zstd",
+    "compression_level": 3,
+    "use_dictionary": ["topic", "msgtype"],
+    "data_page_size": 1 << 20,
+    "write_statistics": True,
+}
+
+# Columns present for every message
+BASE_FIELDS = [
+    pa.field("topic", pa.string()),
+    pa.field("timestamp", pa.timestamp("ns")),
+    pa.field("msgtype", pa.string()),
+    pa.field("header_timestamp", pa.float64()),
+]
+
+# Additional columns extracted for known message types
+MSGTYPE_FIELDS = {
+    'geometry_msgs/msg/PointStamped': [
+        pa.field("x", pa.float64()),
+        pa.field("y", pa.float64()),
+        pa.field("z", pa.float64()),
+    ],
+    'sensor_msgs/msg/Image': [
+        pa.field("width", pa.int64()),
+        pa.field("height", pa.int64()),
+        pa.field("encoding", pa.string()),
+        pa.field("data_size", pa.int64()),
+    ],
+    'sensor_msgs/msg/Imu': [
+        pa.field("accel_x", pa.float64()),
+        pa.field("accel_y", pa.float64()),
+        pa.field("accel_z", pa.float64()),
+        pa.field("gyro_x", pa.float64()),
+        pa.field("gyro_y", pa.float64()),
+        pa.field("gyro_z", pa.float64()),
+    ],
+}
+
+# Message type owning each of the MSGTYPE_FIELDS columns
+FIELD_MSGTYPES = {
+    field.name: msgtype for msgtype, fields in MSGTYPE_FIELDS.items() for field in fields
+}
+
+ERROR_FIELD = pa.field("error", pa.string())
+
+def build_schema(msgtypes: List[str]) -> pa.Schema:
+    """Build the output schema for a set of message types"""
+    fields = list(BASE_FIELDS)
+    for msgtype in dict.fromkeys(msgtypes):
+        fields.extend(MSGTYPE_FIELDS.get(msgtype, []))
+    fields.append(ERROR_FIELD)
+    return pa.schema(fields)
+
+def _group_by_topic(connections: list) -> Dict[str, list]:
+    """Group connections by topic name"""
+    topic_connections = {}
+    for conn in connections:
+        topic_connections.setdefault(conn.topic, []).append(conn)
+    return topic_connections
+
+def _partition_connections(connections: list, n_groups: int) -> List[list]:
+    """Split connections into groups of similar message count
+
+    Connections of the same topic always land in the same group.
+    """
+    groups = [[] for _ in range(n_groups)]
+    loads = [0] * n_groups
+    
+    # Largest topics first, each into the currently lightest group
+    topic_groups = sorted(
+        _group_by_topic(connections).values(),
+        key=lambda conns: sum(conn.msgcount for conn in conns),
+        reverse=True,
+    )
+    for conns in topic_groups:
+        i = loads.index(min(loads))
+        groups[i].extend(conns)
+        loads[i] += sum(conn.msgcount for conn in conns)
+    
+    return [group for group in groups if group]
+
+def _convert_connection_group(bag_path: str, conn_ids: List[int], schema: pa.Schema,
+                              batch_size: int, by_topic: bool, shard_path: str) -> str:
+    """Convert a subset of a bag's connections to a shard file in a worker process
+
+    Connections aren't picklable, so they are passed by id and resolved
+    against the worker's own reader.
+    """
+    processor = ROSbagProcessor(bag_path)
+    typestore = _get_typestore()
+    
+    # Shards are read back once and deleted, so skip compression
+    with AnyReader([processor.bag_path], default_typestore=typestore) as reader, \
+            pq.ParquetWriter(shard_path, schema, compression="none") as writer:
+        connections = [conn for conn in reader.connections if conn.id in conn_ids]
+        for batch in processor._iter_record_batches(
+            reader, connections, schema, batch_size=batch_size, by_topic=by_topic
+        ):
+            writer.write_batch(batch)
+    
+    return shard_path
+
+def _build_batch(columns: Dict[str, list], timestamps: array, schema: pa.Schema) -> pa.RecordBatch:
+    """Assemble a RecordBatch from the column buffers"""
+    num_rows = len(timestamps)
+    msgtypes = pa.array(columns["msgtype"], type=pa.string())
+    masks = {}
+    arrays = []
+    for field in schema:
+        if field.name == "timestamp":
+            # Wrap the raw int64 nanoseconds as-is, no per-row conversion
+            arrays.append(pa.Array.from_buffers(
+                field.type, num_rows, [None, pa.py_buffer(timestamps)]
+            ))
+        elif field.name == "msgtype":
+            arrays.append(msgtypes)
+        else:
+            values = pa.array(columns[field.name], type=field.type)
+            if len(values) < num_rows:
+                # Message type columns only hold their own type's rows;
+                # scatter them into place with nulls everywhere else
+                msgtype = FIELD_MSGTYPES[field.name]
+                if msgtype not in masks:
+                    masks[msgtype] = pc.equal(msgtypes, msgtype)
+                values = pc.replace_with_mask(
+                    pa.nulls(num_rows, field.type), masks[msgtype], values
+                )
+            arrays.append(values)
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+class _BatchBuffer:
+    """Column buffers for the rows of the next RecordBatch"""
+    
+    def __init__(self, schema: pa.Schema):
+        self.schema = schema
+        # One list per schema field; timestamps stay int64 nanoseconds in
+        # a typed array
+        self.columns = {name: [] for name in schema.names if name != "timestamp"}
+        self.timestamps = array('q')
+    
+    def flush(self) -> pa.RecordBatch:
+        """Build a RecordBatch from the buffered rows and empty the buffers"""
+        batch = _build_batch(self.columns, self.timestamps, self.schema)
+        for values in self.columns.values():
+            values.clear()
+        # The batch keeps referencing the old timestamp buffer
+        self.timestamps = array('q')
+        return batch
+
+_get_point = attrgetter('point.x', 'point.y', 'point.z')
+_get_image = attrgetter('width', 'height', 'encoding', 'data')
+_get_imu = attrgetter(
+    'linear_acceleration.x', 'linear_acceleration.y', 'linear_acceleration.z',
+    'angular_velocity.x', 'angular_velocity.y', 'angular_velocity.z',
+)
+
+def _extract_point(msg_obj, columns: Dict[str, list]) -> None:
+    """Extract geometry_msgs/msg/PointStamped fields"""
+    x, y, z = _get_point(msg_obj)
+    columns["x"].append(x)
+    columns["y"].append(y)
+    columns["z"].append(z)
+
+def _extract_image(msg_obj, columns: Dict[str, list]) -> None:
+    """Extract sensor_msgs/msg/Image fields"""
+    width, height, encoding, data = _get_image(msg_obj)
+    columns["width"].append(width)
+    columns["height"].append(height)
+    columns["encoding"].append(encoding)
+    columns["data_size"].append(len(data))
+
+def _extract_imu(msg_obj, columns: Dict[str, list]) -> None:
+    """Extract sensor_msgs/msg/Imu fields"""
+    accel_x, accel_y, accel_z, gyro_x, gyro_y, gyro_z = _get_imu(msg_obj)
+    columns["accel_x"].append(accel_x)
+    columns["accel_y"].append(accel_y)
+    columns["accel_z"].append(accel_z)
+    columns["gyro_x"].append(gyro_x)
+    columns["gyro_y"].append(gyro_y)
+    columns["gyro_z"].append(gyro_z)
+
+def _extract_generic(msg_obj, columns: Dict[str, list]) -> None:
+    """Unknown message types only get the base columns"""
+
+# Field extractors for the message types in MSGTYPE_FIELDS
+HANDLERS = {
+    'geometry_msgs/msg/PointStamped': _extract_point,
+    'sensor_msgs/msg/Image': _extract_image,
+    'sensor_msgs/msg/Imu': _extract_imu,
+}
+
+# Little-endian CDR layouts. Fields are aligned to their size relative to
+# the end of the 4-byte encapsulation header. std_msgs/Header is int32 sec,
+# uint32 nanosec, then the frame_id string (uint32 length incl. NUL + bytes).
+_CDR_HEADER = struct.Struct('<iII')
+_CDR_UINT32X3 = struct.Struct('<3I')
+_CDR_UINT32X2 = struct.Struct('<II')
+_CDR_VECTOR3 = struct.Struct('<3d')
+# Imu angular_velocity, its 3x3 covariance (skipped), linear_acceleration
+_CDR_IMU_RATES = struct.Struct('<3d72x3d')
+
+def _cdr_align(offset: int, size: int) -> int:
+    """Round a buffer offset up to a CDR field alignment"""
+    return ((offset - 4 + size - 1) & -size) + 4
+
+def _cdr_header(rawdata: bytes) -> Tuple[float, int]:
+    """Read the leading Header, returning its stamp and the end offset"""
+    sec, nanosec, frame_id_len = _CDR_HEADER.unpack_from(rawdata, 4)
+    return sec + nanosec / 1e9, 16 + frame_id_len
+
+def _decode_point(rawdata: bytes, columns: Dict[str, list]) -> float:
+    """Extract geometry_msgs/msg/PointStamped fields from raw CDR"""
+    stamp, offset = _cdr_header(rawdata)
+    x, y, z = _CDR_VECTOR3.unpack_from(rawdata, _cdr_align(offset, 8))
+    columns["x"].append(x)
+    columns["y"].append(y)
+    columns["z"].append(z)
+    return stamp
+
+def _decode_image(rawdata: bytes, columns: Dict[str, list]) -> float:
+    """Extract sensor_msgs/msg/Image fields from raw CDR"""
+    stamp, offset = _cdr_header(rawdata)
+    offset = _cdr_align(offset, 4)
+    height, width, encoding_len = _CDR_UINT32X3.unpack_from(rawdata, offset)
+    offset += 12
+    encoding = str(rawdata[offset:offset + encoding_len - 1], 'utf-8')
+    # is_bigendian (uint8) and step (uint32) sit between encoding and the
+    # length prefix of data; the pixel bytes themselves are never touched
+    offset = _cdr_align(offset + encoding_len + 1, 4)
+    _, data_size = _CDR_UINT32X2.unpack_from(rawdata, offset)
+    if offset + 8 + data_size > len(rawdata):
+        raise ValueError(f"Image data of {data_size} bytes exceeds the message buffer")
+    columns["width"].append(width)
+    columns["height"].append(height)
+    columns["encoding"].append(encoding)
+    columns["data_size"].append(data_size)
+    return stamp
+
+def _decode_imu(rawdata: bytes, columns: Dict[str, list]) -> float:
+    """Extract sensor_msgs/msg/Imu fields from raw CDR"""
+    stamp, offset = _cdr_header(rawdata)
+    offset = _cdr_align(offset, 8)
+    # orientation (4 float64) and its 3x3 covariance precede angular_velocity
+    gyro_x, gyro_y, gyro_z, accel_x, accel_y, accel_z = _CDR_IMU_RATES.unpack_from(
+        rawdata, offset + 104
+    )
+    columns["accel_x"].append(accel_x)
+    columns["accel_y"].append(accel_y)
+    columns["accel_z"].append(accel_z)
+    columns["gyro_x"].append(gyro_x)
+    columns["gyro_y"].append(gyro_y)
+    columns["gyro_z"].append(gyro_z)
+    return stamp
+
+# Extractors that read fixed-layout fields straight from little-endian CDR
+# bytes, skipping deserialization. They return the header stamp in seconds.
+CDR_DECODERS = {
+    'geometry_msgs/msg/PointStamped': _decode_point,
+    'sensor_msgs/msg/Image': _decode_image,
+    'sensor_msgs/msg/Imu': _decode_imu,
+}
+
 class ROSbagProcessor:
     """Processes ROSbag files and converts to various formats"""
     
@@ -27,8 +321,11 @@ class ROSbagProcessor:
         self.bag_path = Path(bag_path)
         if not self.bag_path.exists():
             raise FileNotFoundError(f"ROSbag file not found: {bag_path}")
-        
-        self.metadata = self._extract_metadata()
+    
+    @cached_property
+    def metadata(self) -> Dict[str, Any]:
+        """Bag metadata, read on first access since conversion doesn't need it"""
+        return self._extract_metadata()
     
     def _extract_metadata(self) -> Dict[str, Any]:
         """Extract metadata from ROSbag file"""
@@ -57,131 +354,258 @@ class ROSbagProcessor:
     
     def _extract_rosbags_metadata(self) -> Dict[str, Any]:
         """Extract metadata using rosbags library"""
-        typestore = get_typestore(Stores.ROS2_FOXY)
+        typestore = _get_typestore()
         
         with AnyReader([self.bag_path], default_typestore=typestore) as reader:
             topics = [conn.topic for conn in reader.connections]
-            message_count = sum(len(list(reader.messages(connections=[conn]))) for conn in reader.connections)
-            
-            # Get time range
-            start_time = None
-            end_time = None
+            topic_types = {conn.topic: conn.msgtype for conn in reader.connections}
             
-            for conn in reader.connections:
-                messages = list(reader.messages(connections=[conn]))
-                if messages:
-                    for _, timestamp, _ in messages:
-                        if start_time is None or timestamp < start_time:
-                            start_time = timestamp
-                        if end_time is None or timestamp > end_time:
-                            end_time = timestamp
+            # Counts and time bounds come straight from the bag index; only
+            # scan the messages if this reader can't provide them
+            try:
+                message_count = reader.message_count
+                if message_count:
+                    start_time = reader.start_time
+                    end_time = reader.end_time - 1  # end_time is exclusive
+                else:
+                    start_time = end_time = None
+            except (AttributeError, NotImplementedError):
+                message_count, start_time, end_time = self._scan_message_stats(reader)
             
-            duration = (end_time - start_time) / 1e9 if start_time and end_time else 0.0
+            duration = (end_time - start_time) / 1e9 if start_time is not None else 0.0
             
             return {
                 "topics": topics,
+                "topic_types": topic_types,
                 "message_count": message_count,
                 "duration": duration,
                 "start_time": start_time,
                 "end_time": end_time
             }
     
+    @staticmethod
+    def _scan_message_stats(reader) -> Tuple[int, Optional[int], Optional[int]]:
+        """Count messages and find the time range in a single pass"""
+        message_count = 0
+        start_time = None
+        end_time = None
+        
+        for _, timestamp, _ in reader.messages():
+            message_count += 1
+            if start_time is None or timestamp < start_time:
+                start_time = timestamp
+            if end_time is None or timestamp > end_time:
+                end_time = timestamp
+        
+        return message_count, start_time, end_time
+    
     def get_topics(self) -> List[str]:
         """Get list of available topics"""
         return self.metadata.get('topics', [])
     
-    def convert_to_parquet(self, output_path: str, topics: Optional[List[str]] = None) -> str:
+    def get_topic_types(self) -> Dict[str, str]:
+        """Get mapping of topic to message type"""
+        return self.metadata.get('topic_types', {})
+    
+    def convert_to_parquet(self, output_path: str, topics: Optional[List[str]] = None,
+                           max_workers: Optional[int] = None) -> str:
         """Convert ROSbag to Parquet format"""
-        output_path = Path(output_path)
+        if not ROSBAGS_AVAILABLE:
+            raise RuntimeError("rosbags library not available. Install with: pip install 'robolake-cli[rosbags]'")
         
-        # Get data as DataFrame first
-        df = self.convert_to_dataframe(topics)
+        output_path = Path(output_path)
+        typestore = _get_typestore()
         
-        # Convert to PyArrow table and write to Parquet
-        table = pa.Table.from_pandas(df)
-        pq.write_table(table, output_path)
+        with AnyReader([self.bag_path], default_typestore=typestore) as reader:
+            connections = self._select_connections(reader, topics)
+            schema = build_schema([conn.msgtype for conn in connections])
+            
+            # Stream batches straight to disk so memory stays bounded. Each
+            # batch, and so each row group, holds a single topic, so row-group
+            # min/max statistics let DuckDB skip row groups on topic filters.
+            batches = self._record_batches(
+                reader, connections, schema, batch_size=ROW_GROUP_SIZE,
+                by_topic=True, max_workers=max_workers
+            )
+            with pq.ParquetWriter(output_path, schema, **PARQUET_WRITE_OPTIONS) as writer:
+                for batch in batches:
+                    writer.write_batch(batch)
         
         return str(output_path)
     
-    def convert_to_dataframe(self, topics: Optional[List[str]] = None) -> pd.DataFrame:
+    def convert_to_dataframe(self, topics: Optional[List[str]] = None,
+                             max_workers: Optional[int] = None) -> pd.DataFrame:
         """Convert ROSbag to Pandas DataFrame"""
         if not ROSBAGS_AVAILABLE:
             raise RuntimeError("rosbags library not available. Install with: pip install 'robolake-cli[rosbags]'")
         
-        return self._convert_rosbags_to_dataframe(topics)
+        return self._convert_rosbags_to_dataframe(topics, max_workers)
     
-    def _convert_rosbags_to_dataframe(self, topics: Optional[List[str]] = None) -> pd.DataFrame:
+    def _convert_rosbags_to_dataframe(self, topics: Optional[List[str]] = None,
+                                      max_workers: Optional[int] = None) -> pd.DataFrame:
         """Convert ROSbag to DataFrame using rosbags library"""
-        if topics is None:
-            topics = self.get_topics()
-        
-        data = []
-        typestore = get_typestore(Stores.ROS2_FOXY)
+        typestore = _get_typestore()
         
         with AnyReader([self.bag_path], default_typestore=typestore) as reader:
-            # Filter connections by topics if specified
-            connections = reader.connections
-            if topics:
-                connections = [conn for conn in connections if conn.topic in topics]
-            
-            for connection, timestamp, rawdata in reader.messages(connections=connections):
-                # Extract message data
-                msg_data = self._extract_message_data(reader, connection, timestamp, rawdata)
-                data.append(msg_data)
+            connections = self._select_connections(reader, topics)
+            schema = build_schema([conn.msgtype for conn in connections])
+            batches = list(self._record_batches(
+                reader, connections, schema, max_workers=max_workers
+            ))
+            parallel = self._worker_count(connections, max_workers) > 1
         
-        return pd.DataFrame(data)
+        table = pa.Table.from_batches(batches, schema=schema)
+        del batches
+        if parallel:
+            # Worker results are concatenated group by group
+            table = table.sort_by("timestamp")
+        # One block per column skips pandas' consolidation copy, and
+        # self_destruct frees each Arrow column once converted; the table
+        # is unusable afterwards, so it must not escape this method
+        return table.to_pandas(split_blocks=True, self_destruct=True)
+    
+    @staticmethod
+    def _worker_count(connections: list, max_workers: Optional[int] = None) -> int:
+        """Number of worker processes to convert these connections with"""
+        if sum(conn.msgcount for conn in connections) < PARALLEL_MIN_MESSAGES:
+            return 1
+        max_workers = max_workers or os.cpu_count() or 1
+        return min(max_workers, len(_group_by_topic(connections)))
     
-    def _extract_message_data(self, reader, connection, timestamp, rawdata) -> Dict[str, Any]:
-        """Extract data from ROSbag message"""
+    def _record_batches(self, reader, connections: list, schema: pa.Schema,
+                        batch_size: int = BATCH_SIZE, by_topic: bool = False,
+                        max_workers: Optional[int] = None) -> Iterator[pa.RecordBatch]:
+        """Yield RecordBatches for connections, in parallel for large bags"""
+        n_workers = self._worker_count(connections, max_workers)
+        if n_workers <= 1:
+            yield from self._iter_record_batches(
+                reader, connections, schema, batch_size=batch_size, by_topic=by_topic
+            )
+            return
+        
+        # Deserialization is CPU-bound, so fan connection groups out to
+        # worker processes that each open their own reader. Workers stream
+        # to shard files rather than returning tables, so neither side holds
+        # a whole group in memory; shards are read back batch by batch.
+        groups = _partition_connections(connections, n_workers)
+        with tempfile.TemporaryDirectory(prefix="robolake-") as shard_dir, \
+                ProcessPoolExecutor(max_workers=len(groups)) as executor:
+            futures = [
+                executor.submit(
+                    _convert_connection_group, str(self.bag_path),
+                    [conn.id for conn in group], schema, batch_size, by_topic,
+                    os.path.join(shard_dir, f"shard-{i}.parquet")
+                )
+                for i, group in enumerate(groups)
+            ]
+            for future in futures:
+                shard_path = future.result()
+                # Read back row group by row group, so batches never span
+                # two of the worker's batches (and topics)
+                shard = pq.ParquetFile(shard_path)
+                for i in range(shard.num_row_groups):
+                    yield from shard.read_row_group(i).combine_chunks().to_batches()
+                os.remove(shard_path)
+    
+    @staticmethod
+    def _select_connections(reader, topics: Optional[List[str]] = None) -> list:
+        """Filter reader connections by topics if specified"""
+        if not topics:
+            return list(reader.connections)
+        return [conn for conn in reader.connections if conn.topic in topics]
+    
+    @staticmethod
+    def _stamp_getter(reader, msgtype: str) -> Optional[Callable]:
+        """Header stamp accessor for a message type, from its registered definition"""
         try:
-            # Try to deserialize the message
-            msg_obj = reader.deserialize(rawdata, connection.msgtype)
-            
-            # Extract basic metadata
-            data = {
-                "topic": connection.topic,
-                "timestamp": timestamp / 1e9,  # Convert to seconds
-                "msgtype": connection.msgtype
-            }
-            
-            # Extract header timestamp if available
-            if hasattr(msg_obj, 'header') and hasattr(msg_obj.header, 'stamp'):
-                header_stamp = msg_obj.header.stamp
-                if hasattr(header_stamp, 'sec') and hasattr(header_stamp, 'nanosec'):
-                    data["header_timestamp"] = header_stamp.sec + header_stamp.nanosec / 1e9
-            
-            # Extract specific data based on message type
-            if connection.msgtype == 'geometry_msgs/msg/PointStamped':
-                if hasattr(msg_obj, 'point'):
-                    point = msg_obj.point
-                    data["x"] = point.x
-                    data["y"] = point.y
-                    data["z"] = point.z
-            elif connection.msgtype == 'sensor_msgs/msg/Image':
-                if hasattr(msg_obj, 'width') and hasattr(msg_obj, 'height'):
-                    data["width"] = msg_obj.width
-                    data["height"] = msg_obj.height
-                    data["encoding"] = msg_obj.encoding
-                    data["data_size"] = len(msg_obj.data) if hasattr(msg_obj, 'data') else 0
-            elif connection.msgtype == 'sensor_msgs/msg/Imu':
-                if hasattr(msg_obj, 'linear_acceleration'):
-                    acc = msg_obj.linear_acceleration
-                    data["accel_x"] = acc.x
-                    data["accel_y"] = acc.y
-                    data["accel_z"] = acc.z
-                if hasattr(msg_obj, 'angular_velocity'):
-                    gyro = msg_obj.angular_velocity
-                    data["gyro_x"] = gyro.x
-                    data["gyro_y"] = gyro.y
-                    data["gyro_z"] = gyro.z
+            fields = dict(reader.typestore.get_msgdef(msgtype).fields)
+        except Exception as e:
+            logging.warning(f"Error looking up message definition of {msgtype}: {e}")
+            return None
+        
+        # Field definitions are (node type, type name) pairs for nested messages
+        _, header_type = fields.get('header', (None, None))
+        if header_type == 'std_msgs/msg/Header':
+            return attrgetter('header.stamp.sec', 'header.stamp.nanosec')
+        return None
+    
+    def _iter_record_batches(self, reader, connections: list, schema: pa.Schema,
+                             batch_size: int = BATCH_SIZE, by_topic: bool = False) -> Iterator[pa.RecordBatch]:
+        """Yield messages as RecordBatches of at most batch_size rows
+        
+        With by_topic, every batch holds a single topic's rows. The bag is
+        still read once in time order, into one buffer per topic.
+        """
+        # The reader treats an empty connection list as all connections
+        if not connections:
+            return
+        
+        # Message layout is fixed per msgtype, so its definition in the
+        # reader's typestore tells once whether it carries a header stamp
+        stamp_getters = {}
+        for conn in connections:
+            if conn.msgtype not in stamp_getters:
+                stamp_getters[conn.msgtype] = self._stamp_getter(reader, conn.msgtype)
+        
+        # Resolve everything the loop needs once per connection, so each
+        # message costs a single dict lookup. Message type columns only
+        # receive their own type's rows; _build_batch fills in the nulls.
+        buffers = {}
+        conn_info = {}
+        for conn in connections:
+            key = conn.topic if by_topic else None
+            if key not in buffers:
+                buffers[key] = _BatchBuffer(schema)
+            buffer = buffers[key]
+            columns = buffer.columns
+            own_columns = [columns[field.name] for field in MSGTYPE_FIELDS.get(conn.msgtype, [])]
+            # rosbag2 CDR payloads of known layout skip deserialization
+            is_cdr = getattr(conn.ext, 'serialization_format', None) == 'cdr'
+            conn_info[id(conn)] = (
+                buffer, columns, columns["topic"], columns["msgtype"],
+                columns["header_timestamp"], columns["error"],
+                conn.topic, conn.msgtype, HANDLERS.get(conn.msgtype, _extract_generic),
+                CDR_DECODERS.get(conn.msgtype) if is_cdr else None,
+                own_columns, stamp_getters[conn.msgtype]
+            )
+        
+        deserialize = reader.deserialize
+        for connection, timestamp, rawdata in reader.messages(connections=connections):
+            (buffer, columns, topic_col, msgtype_col, header_col, error_col,
+             topic, msgtype, handler, decoder, own_columns, get_stamp) = conn_info[id(connection)]
+            rows = len(topic_col)
+            topic_col.append(topic)
+            buffer.timestamps.append(timestamp)
+            msgtype_col.append(msgtype)
             
-            return data
+            try:
+                # Byte 1 of the encapsulation header is 1 for little-endian CDR
+                if decoder is not None and rawdata[1] == 1:
+                    header_col.append(decoder(rawdata, columns))
+                else:
+                    msg_obj = deserialize(rawdata, msgtype)
+                    if get_stamp is None:
+                        header_col.append(None)
+                    else:
+                        sec, nanosec = get_stamp(msg_obj)
+                        header_col.append(sec + nanosec / 1e9)
+                    handler(msg_obj, columns)
+                error_col.append(None)
+            except Exception as e:
+                logging.warning(f"Error extracting message data: {e}")
+                # Drop any partially extracted fields and null out the row
+                if own_columns:
+                    own_rows = min(len(values) for values in own_columns)
+                    for values in own_columns:
+                        del values[own_rows:]
+                        values.append(None)
+                if len(header_col) == rows:
+                    header_col.append(None)
+                error_col.append(str(e))
             
-        except Exception as e:
-            logging.warning(f"Error extracting message data: {e}")
-            return {
-                "topic": connection.topic,
-                "timestamp": timestamp / 1e9,
-                "error": str(e),
-                "msgtype": connection.msgtype
-            } 
\ No newline at end of file
+            if rows + 1 == batch_size:
+                yield buffer.flush()
+        
+        for buffer in buffers.values():
+            if buffer.timestamps:
+                yield buffer.flush()
\ No newline at end of file
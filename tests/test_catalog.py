@@ -0,0 +1,89 @@
+"""
+Regression tests for the catalog layout migration in robolake_cli.catalog
+
+Catalogs written by older versions store timestamp as float seconds, in
+single-file tables or in part files; both must stay queryable next to
+timestamp[ns] parts written by the current version.
+"""
+
+import tempfile
+import unittest
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from robolake_cli.catalog import CATALOG_VERSION, CATALOG_VERSION_FILE, DataCatalog
+
+def _float_seconds_table(seconds: list) -> pd.DataFrame:
+    """Rows as older versions wrote them, with float seconds timestamps"""
+    return pd.DataFrame({
+        "timestamp": seconds,
+        "topic": ["/imu"] * len(seconds),
+        "value": [float(i) for i in range(len(seconds))],
+    })
+
+def _nanoseconds(seconds: list) -> list:
+    """Expected timestamps for float seconds, as timestamp[ns] values"""
+    return [pd.Timestamp(round(s * 1e9), unit="ns") for s in seconds]
+
+class CatalogMigrationTest(unittest.TestCase):
+    """Open catalogs written by older versions"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.catalog_path = Path(self.tmp_dir.name) / "catalog"
+        self.tables_dir = self.catalog_path / "tables"
+        self.tables_dir.mkdir(parents=True)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_single_file_table_is_migrated(self):
+        seconds = [1.5, 2.25, 1_700_000_000.123456789]
+        _float_seconds_table(seconds).to_parquet(self.tables_dir / "legacy.parquet")
+
+        catalog = DataCatalog(str(self.catalog_path))
+
+        self.assertFalse((self.tables_dir / "legacy.parquet").exists())
+        self.assertEqual(catalog.list_tables(), ["legacy"])
+        result = catalog.query("SELECT timestamp, value FROM legacy ORDER BY value")
+        self.assertEqual(list(result["timestamp"]), _nanoseconds(seconds))
+        self.assertEqual(list(result["value"]), [0.0, 1.0, 2.0])
+        self.assertEqual(
+            (self.catalog_path / CATALOG_VERSION_FILE).read_text(), str(CATALOG_VERSION)
+        )
+
+    def test_float_part_is_migrated_next_to_new_part(self):
+        table_dir = self.tables_dir / "mixed"
+        table_dir.mkdir()
+        (self.catalog_path / CATALOG_VERSION_FILE).write_text("1")
+        old_seconds = [10.0, 10.5]
+        _float_seconds_table(old_seconds).to_parquet(table_dir / "part-old.parquet")
+
+        # A part as the current version writes it, with its own extra column
+        new_timestamps = pa.array([11_000_000_001, 12_000_000_002], type=pa.timestamp("ns"))
+        pq.write_table(pa.table({
+            "timestamp": new_timestamps,
+            "topic": ["/gps", "/gps"],
+            "latitude": [1.0, 2.0],
+        }), table_dir / "part-new.parquet")
+
+        catalog = DataCatalog(str(self.catalog_path))
+
+        self.assertEqual(
+            pq.read_schema(table_dir / "part-old.parquet").field("timestamp").type,
+            pa.timestamp("ns"),
+        )
+        info = catalog.get_table_info("mixed")
+        self.assertEqual(info["row_count"], 4)
+        result = catalog.query("SELECT timestamp, topic FROM mixed ORDER BY timestamp")
+        self.assertEqual(
+            list(result["timestamp"]),
+            _nanoseconds(old_seconds) + [pd.Timestamp(v.value, unit="ns") for v in new_timestamps],
+        )
+        self.assertEqual(list(result["topic"]), ["/imu", "/imu", "/gps", "/gps"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+"""
+Regression tests for the raw CDR decoders in robolake_cli.processor
+
+Each decoder must extract exactly what deserializing the message and
+running the matching HANDLERS extractor does.
+"""
+
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from robolake_cli.processor import CDR_DECODERS, HANDLERS, MSGTYPE_FIELDS, ROSBAGS_AVAILABLE
+
+if ROSBAGS_AVAILABLE:
+    from rosbags.highlevel import AnyReader
+    from rosbags.rosbag2 import Writer
+    from rosbags.typesys import Stores, get_typestore
+
+ENCODINGS = ['rgb8', 'mono8', '16UC1', 'yuv422_yuy2', '']
+
+def _write_bag(bag_path: Path, typestore) -> None:
+    """Write PointStamped, Imu and Image messages with varying string lengths"""
+    types = typestore.types
+    rng = np.random.default_rng(0)
+
+    with Writer(bag_path, version=8) as writer:
+        point_conn = writer.add_connection('/pos', 'geometry_msgs/msg/PointStamped', typestore=typestore)
+        imu_conn = writer.add_connection('/imu', 'sensor_msgs/msg/Imu', typestore=typestore)
+        image_conn = writer.add_connection('/cam', 'sensor_msgs/msg/Image', typestore=typestore)
+
+        for i in range(40):
+            # frame_id lengths cover every alignment the header can end on
+            header = types['std_msgs/msg/Header'](
+                stamp=types['builtin_interfaces/msg/Time'](sec=i, nanosec=i * 12345),
+                frame_id='f' * (i % 17),
+            )
+            values = rng.normal(size=10)
+            vector3 = types['geometry_msgs/msg/Vector3']
+
+            point = types['geometry_msgs/msg/PointStamped'](
+                header=header,
+                point=types['geometry_msgs/msg/Point'](x=values[0], y=values[1], z=values[2]),
+            )
+            imu = types['sensor_msgs/msg/Imu'](
+                header=header,
+                orientation=types['geometry_msgs/msg/Quaternion'](
+                    x=values[3], y=0.0, z=0.0, w=1.0
+                ),
+                orientation_covariance=rng.normal(size=9),
+                angular_velocity=vector3(x=values[4], y=values[5], z=values[6]),
+                angular_velocity_covariance=rng.normal(size=9),
+                linear_acceleration=vector3(x=values[7], y=values[8], z=values[9]),
+                linear_acceleration_covariance=rng.normal(size=9),
+            )
+            width = (i * 7) % 13
+            image = types['sensor_msgs/msg/Image'](
+                header=header, height=i, width=width, encoding=ENCODINGS[i % len(ENCODINGS)],
+                is_bigendian=0, step=width, data=np.arange(width * 3, dtype=np.uint8),
+            )
+
+            timestamp = 1_000_000_000 + i * 1_000_000
+            for conn, msg in ((point_conn, point), (imu_conn, imu), (image_conn, image)):
+                writer.write(conn, timestamp, typestore.serialize_cdr(msg, conn.msgtype))
+
+def _empty_columns(msgtype: str) -> dict:
+    """Column buffers for one message type's extracted fields"""
+    return {field.name: [] for field in MSGTYPE_FIELDS[msgtype]}
+
+@unittest.skipUnless(ROSBAGS_AVAILABLE, "rosbags library not available")
+class CdrDecoderTest(unittest.TestCase):
+    """Compare CDR_DECODERS against deserialize plus HANDLERS"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.typestore = get_typestore(Stores.ROS2_FOXY)
+        cls.bag_path = Path(cls.tmp_dir.name) / "bag"
+        _write_bag(cls.bag_path, cls.typestore)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def test_decoders_match_deserialize(self):
+        with AnyReader([self.bag_path], default_typestore=self.typestore) as reader:
+            self.assertEqual(
+                {conn.msgtype for conn in reader.connections}, set(CDR_DECODERS)
+            )
+            for conn, _, rawdata in reader.messages():
+                decoded = _empty_columns(conn.msgtype)
+                stamp = CDR_DECODERS[conn.msgtype](rawdata, decoded)
+
+                expected = _empty_columns(conn.msgtype)
+                msg_obj = reader.deserialize(rawdata, conn.msgtype)
+                HANDLERS[conn.msgtype](msg_obj, expected)
+
+                self.assertEqual(decoded, expected, conn.msgtype)
+                self.assertEqual(stamp, msg_obj.header.stamp.sec + msg_obj.header.stamp.nanosec / 1e9)
+
+    def test_truncated_image_is_rejected(self):
+        with AnyReader([self.bag_path], default_typestore=self.typestore) as reader:
+            connections = [conn for conn in reader.connections if conn.topic == '/cam']
+            for _, _, rawdata in reader.messages(connections=connections):
+                data_size = len(reader.deserialize(rawdata, 'sensor_msgs/msg/Image').data)
+                if data_size:
+                    break
+
+        # Cut off the pixel bytes but keep their length prefix
+        truncated = rawdata[:-data_size]
+        with self.assertRaises(ValueError):
+            CDR_DECODERS['sensor_msgs/msg/Image'](truncated, _empty_columns('sensor_msgs/msg/Image'))
+
+if __name__ == "__main__":
+    unittest.main()